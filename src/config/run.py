@@ -1,11 +1,20 @@
 import logging
+import logging.handlers
+import queue
 from dataclasses import dataclass
 import pyaudio
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging. Records go through a queue to a background listener
+# thread, so the audio threads only pay for the enqueue - formatting and
+# stream IO happen off the hot path
+_log_queue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+_log_listener.start()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
 logger = logging.getLogger(__name__)
 
 
@@ -31,6 +40,8 @@ class AudioConfig:
     chunk_size: int = 320     # 20ms at 16kHz (320 samples) - WebRTC VAD requirement
     channels: int = 1
     format: int = pyaudio.paInt16
+    output_sample_rate: int = 24000  # TTS native rate; playing at it avoids resampling
+    max_buffer_seconds: float = 30.0  # Playback backlog cap; beyond it new audio is dropped
 
 
 @dataclass
@@ -41,6 +52,8 @@ class VADConfig:
     max_silence_duration: float = 1.5 # Max silence before ending voice session (seconds)
     voice_start_threshold: int = 5    # Consecutive voice frames to start
     voice_end_threshold: int = 10     # Consecutive silence frames to end
+    silero_model_path: Optional[str] = None  # Path to silero_vad.onnx (neural VAD, optional)
+    silero_threshold: float = 0.5     # Speech probability threshold for Silero
 
 
 @dataclass
@@ -1,48 +1,124 @@
 from openai import AsyncOpenAI
 import asyncio
+import httpx
+import io
+import re
+import struct
+import numpy as np
 from typing import Optional, Callable
 from src.config.run import logger
 import os
 
+# Sentence boundary for TTS chunking; the lookahead keeps decimals like
+# "3.14" intact mid-stream
+_SENT_END = re.compile(r'[.!?](?:\s|$)')
+
+try:
+    import numba
+except ImportError:
+    numba = None  # JIT is optional, the numpy kernel works without it
+
+
+def _polyphase_24k_to_16k(audio_array, fir):
+    """3:2 polyphase kernel: zero-stuff by 2, low-pass, keep every 3rd sample"""
+    upsampled = np.zeros(audio_array.size * 2, dtype=np.float32)
+    upsampled[::2] = audio_array
+    filtered = np.convolve(upsampled, fir)
+    resampled = filtered[::3]
+    return np.clip(resampled, -32768.0, 32767.0).astype(np.int16)
+
+
+if numba is not None:
+    _polyphase_24k_to_16k = numba.njit(cache=True, fastmath=True)(_polyphase_24k_to_16k)
+
 
 class ParallelOpenAIHandler:
     """Handles parallel OpenAI API interactions with VAD-processed audio"""
-    
+
     def __init__(self, api_key: Optional[str] = None):
-        self.client = AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        # One pooled HTTP/2 client shared by whisper, chat and TTS so the
+        # TLS/TCP handshake is paid once per session instead of per request
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=16,
+                max_keepalive_connections=16,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(30.0, connect=3.0)
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            http_client=self._http_client
+        )
+
+        # 64-tap windowed-sinc low-pass at 8kHz, designed once for the fixed
+        # 24kHz -> 16kHz (up=2, down=3) polyphase resampling path
+        n = np.arange(64)
+        fir = np.sinc((n - 31.5) / 3.0) * np.hamming(64)
+        self._resample_fir = (2.0 * fir / fir.sum()).astype(np.float32)
+
+        # 44-byte WAV header template for 16kHz mono s16le; per upload only
+        # the two size fields are patched in place
+        self._wav_header_tpl = struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 0, b'WAVE',
+            b'fmt ', 16, 1, 1, 16000, 32000, 2, 16,
+            b'data', 0
+        )
         
-    async def transcribe_voice_session(self, audio_chunks: list[bytes]) -> Optional[str]:
-        """Transcribe a complete voice session from VAD"""
+    async def warmup(self):
+        """Open a pooled connection before the first real request"""
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            logger.error(f"Warmup request failed: {e}")
+
+    async def transcribe_voice_session(
+        self,
+        audio_data: bytes,
+        prompt: Optional[str] = None,
+        on_partial: Optional[Callable[[str], None]] = None
+    ) -> Optional[str]:
+        """Transcribe a complete voice session (raw 16kHz s16le PCM) from VAD"""
         try:
-            if not audio_chunks:
+            if not audio_data:
                 return None
-            
-            # Combine all audio chunks
-            combined_audio = b''.join(audio_chunks)
-            
-            # Convert to WAV format for Whisper
-            import io
-            import wave
-            
-            audio_io = io.BytesIO()
-            with wave.open(audio_io, 'wb') as wav_file:
-                wav_file.setnchannels(1)
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(16000)
-                wav_file.writeframes(combined_audio)
-            
-            audio_io.seek(0)
+
+            # Patch the cached WAV header with the actual sizes and prepend
+            # it in a single concat - no wave module round-trip
+            header = bytearray(self._wav_header_tpl)
+            struct.pack_into('<I', header, 4, 36 + len(audio_data))
+            struct.pack_into('<I', header, 40, len(audio_data))
+
+            audio_io = io.BytesIO(header + audio_data)
             audio_io.name = "voice_session.wav"
-            
-            response = await self.client.audio.transcriptions.create(
-                model="whisper-1",
+
+            # Already-confirmed text biases the decode so the final pass
+            # doesn't re-derive tokens interim passes agreed on
+            extra_args = {"prompt": prompt} if prompt else {}
+
+            # Streamed decode: the first delta arrives while the rest of the
+            # transcript is still being generated server-side
+            stream = await self.client.audio.transcriptions.create(
+                model="gpt-4o-mini-transcribe",
                 file=audio_io,
-                response_format="text"
+                response_format="text",
+                stream=True,
+                **extra_args
             )
-            
-            text = response.strip()
+
+            text_parts = []
+            async for event in stream:
+                delta = getattr(event, 'delta', None)
+                if delta:
+                    text_parts.append(delta)
+                    if on_partial:
+                        on_partial(delta)
+
+            text = ''.join(text_parts).strip()
             return text if text else None
-            
+
         except Exception as e:
             logger.error(f"Transcription error: {e}")
             return None
@@ -55,11 +131,15 @@ class ParallelOpenAIHandler:
         voice: str = "alloy"
     ):
         """Generate text and audio in parallel streams"""
-        
+
+        # Text deltas flow through this queue so TTS can start on the first
+        # complete sentence instead of waiting for the whole response
+        text_queue = asyncio.Queue()
+
         # Text generation task
         async def text_stream_task():
             try:
-                full_text = ""
+                text_parts = []
                 stream = await self.client.chat.completions.create(
                     model="gpt-4o-mini",
                     messages=messages,
@@ -67,95 +147,160 @@ class ParallelOpenAIHandler:
                     temperature=0.7,
                     stream=True
                 )
-                
+
                 async for chunk in stream:
                     if chunk.choices[0].delta.content:
                         text_chunk = chunk.choices[0].delta.content
-                        full_text += text_chunk
-                        
+                        text_parts.append(text_chunk)
+
                         # Immediate text callback
                         text_callback(text_chunk)
-                
-                return full_text
-                
+
+                        # Hand the delta to the audio task right away
+                        await text_queue.put(text_chunk)
+
+                # One join instead of O(N^2) string concatenation
+                return ''.join(text_parts)
+
             except Exception as e:
                 logger.error(f"Text generation error: {e}")
                 return "I'm sorry, I couldn't process that."
-        
+            finally:
+                # Sentinel so the audio task knows text is done
+                await text_queue.put(None)
+
         # Audio generation task (runs in parallel)
-        async def audio_stream_task(response_text_future):
-            try:
-                # Wait for some initial text before starting TTS
-                await asyncio.sleep(0.5)
-                
-                # We'll collect text in sentences and convert to audio
-                sentence_buffer = ""
-                sentence_endings = '.!?'
-                processed_length = 0
-                
-                while True:
-                    try:
-                        # Get the current full text
-                        if response_text_future.done():
-                            full_text = response_text_future.result()
-                            remaining_text = full_text[processed_length:]
-                            
-                            if remaining_text:
-                                sentence_buffer += remaining_text
-                                processed_length = len(full_text)
-                        else:
-                            # Still generating, wait a bit
-                            await asyncio.sleep(0.1)
-                            continue
-                        
-                        # Process complete sentences
-                        while any(ending in sentence_buffer for ending in sentence_endings):
-                            earliest_pos = len(sentence_buffer)
-                            for ending in sentence_endings:
-                                pos = sentence_buffer.find(ending)
-                                if pos != -1 and pos < earliest_pos:
-                                    earliest_pos = pos
-                            
-                            if earliest_pos < len(sentence_buffer):
-                                sentence = sentence_buffer[:earliest_pos + 1].strip()
-                                sentence_buffer = sentence_buffer[earliest_pos + 1:].strip()
-                                
-                                if sentence:
-                                    # Convert to audio (this runs independently)
-                                    audio_data = await self._text_to_speech_chunk(sentence, voice)
-                                    if audio_data:
-                                        # Resample from 24kHz to 16kHz for output consistency
-                                        resampled_audio = self._resample_audio(audio_data, 24000, 16000)
-                                        audio_callback(resampled_audio)
-                        
-                        # If text generation is complete and no more sentences, process remaining
-                        if response_text_future.done() and sentence_buffer.strip():
-                            audio_data = await self._text_to_speech_chunk(sentence_buffer.strip(), voice)
-                            if audio_data:
-                                resampled_audio = self._resample_audio(audio_data, 24000, 16000)
-                                audio_callback(resampled_audio)
-                            break
-                            
-                        # If text generation is complete and no remaining text, break
-                        if response_text_future.done() and not sentence_buffer.strip():
+        async def audio_stream_task():
+            # Completed sentences become TTS tasks immediately so multiple
+            # sentences synthesize concurrently; playback consumes the tasks
+            # in submission order to keep audio sequential
+            tts_queue = asyncio.Queue()
+
+            async def synthesis_dispatcher():
+                try:
+                    sentence_buffer = ""
+                    scan_start = 0  # Confirmed prefix is never re-scanned
+
+                    while True:
+                        text_chunk = await text_queue.get()
+                        if text_chunk is None:
                             break
-                            
-                    except Exception as e:
-                        logger.error(f"Audio processing error: {e}")
+
+                        sentence_buffer += text_chunk
+
+                        # Process complete sentences with one C-level scan
+                        while (m := _SENT_END.search(sentence_buffer, scan_start)):
+                            sentence = sentence_buffer[:m.end()].strip()
+                            sentence_buffer = sentence_buffer[m.end():].lstrip()
+                            scan_start = 0
+
+                            if sentence:
+                                # Kick off TTS without waiting for it
+                                await tts_queue.put(asyncio.create_task(
+                                    self._text_to_speech_chunk(sentence, voice)
+                                ))
+
+                        # No boundary in the buffer (a trailing terminator
+                        # would have matched $), so next scan starts at the
+                        # new tail
+                        scan_start = len(sentence_buffer)
+
+                    # Text is complete, synthesize whatever is left
+                    if sentence_buffer.strip():
+                        await tts_queue.put(asyncio.create_task(
+                            self._text_to_speech_chunk(sentence_buffer.strip(), voice)
+                        ))
+
+                except Exception as e:
+                    logger.error(f"Audio processing error: {e}")
+                finally:
+                    await tts_queue.put(None)
+
+            async def playback_emitter():
+                while True:
+                    tts_task = await tts_queue.get()
+                    if tts_task is None:
                         break
-                        
+
+                    audio_data = await tts_task
+                    if audio_data:
+                        # TTS PCM is already at the output stream's 24kHz,
+                        # so it goes straight to playback
+                        audio_callback(audio_data)
+
+            try:
+                await asyncio.gather(synthesis_dispatcher(), playback_emitter())
             except Exception as e:
                 logger.error(f"Audio generation error: {e}")
-        
+
         # Run both tasks in parallel
         text_task = asyncio.create_task(text_stream_task())
-        audio_task = asyncio.create_task(audio_stream_task(text_task))
+        audio_task = asyncio.create_task(audio_stream_task())
         
         # Wait for both to complete
         results = await asyncio.gather(text_task, audio_task, return_exceptions=True)
         
         return results[0] if not isinstance(results[0], Exception) else "Error generating response"
     
+    async def generate_text_response(self, messages: list) -> str:
+        """Text-only streamed completion - no callbacks, no TTS.
+
+        Used for speculative prefill, which must stay free of side
+        effects while the user is still speaking. Errors propagate to
+        the caller so a failed speculation can simply be redone for real.
+        """
+        text_parts = []
+        stream = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=150,
+            temperature=0.7,
+            stream=True
+        )
+
+        async for chunk in stream:
+            if chunk.choices[0].delta.content:
+                text_parts.append(chunk.choices[0].delta.content)
+
+        return ''.join(text_parts)
+
+    async def synthesize_response(
+        self,
+        text: str,
+        audio_callback: Callable[[bytes], None],
+        voice: str = "alloy"
+    ):
+        """Synthesize already-generated text sentence by sentence.
+
+        Sentences are dispatched to TTS concurrently and emitted in
+        order, mirroring generate_parallel_response's audio path for
+        text produced earlier (e.g. a confirmed speculative response).
+        """
+        try:
+            tts_tasks = []
+            start = 0
+            for m in _SENT_END.finditer(text):
+                sentence = text[start:m.end()].strip()
+                start = m.end()
+                if sentence:
+                    tts_tasks.append(asyncio.create_task(
+                        self._text_to_speech_chunk(sentence, voice)
+                    ))
+
+            tail = text[start:].strip()
+            if tail:
+                tts_tasks.append(asyncio.create_task(
+                    self._text_to_speech_chunk(tail, voice)
+                ))
+
+            for tts_task in tts_tasks:
+                audio_data = await tts_task
+                if audio_data:
+                    audio_callback(audio_data)
+
+        except Exception as e:
+            logger.error(f"Audio generation error: {e}")
+
     async def _text_to_speech_chunk(self, text: str, voice: str) -> Optional[bytes]:
         """Convert a text chunk to speech"""
         try:
@@ -163,7 +308,7 @@ class ParallelOpenAIHandler:
                 model="tts-1",
                 voice=voice,
                 input=text,
-                response_format="wav"
+                response_format="pcm"  # Raw 24kHz s16le, no container to parse
             )
             return response.content
         except Exception as e:
@@ -171,37 +316,14 @@ class ParallelOpenAIHandler:
             return None
     
     def _resample_audio(self, audio_data: bytes, source_rate: int, target_rate: int) -> bytes:
-        """Simple audio resampling (basic implementation)"""
+        """Resample raw s16le PCM through the cached 24kHz -> 16kHz polyphase filter"""
         if source_rate == target_rate:
             return audio_data
-        
+
         try:
-            # Extract WAV data (skip header)
-            import wave
-            import io
-            
-            # Read WAV data
-            wav_io = io.BytesIO(audio_data)
-            with wave.open(wav_io, 'rb') as wav_file:
-                frames = wav_file.readframes(wav_file.getnframes())
-            
-            # Convert to numpy for resampling
-            import numpy as np
-            audio_array = np.frombuffer(frames, dtype=np.int16)
-            
-            # Simple decimation/interpolation
-            ratio = target_rate / source_rate
-            target_length = int(len(audio_array) * ratio)
-            
-            # Linear interpolation
-            resampled = np.interp(
-                np.linspace(0, len(audio_array), target_length),
-                np.arange(len(audio_array)),
-                audio_array
-            ).astype(np.int16)
-            
-            return resampled.tobytes()
-            
+            audio_array = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
+            return _polyphase_24k_to_16k(audio_array, self._resample_fir).tobytes()
+
         except Exception as e:
             logger.error(f"Resampling error: {e}")
             return audio_data  # Return original if resampling fails
@@ -1,12 +1,69 @@
 import webrtcvad
 from collections import deque
 from typing import Optional, Callable
+import queue
+import threading
 import time
 import asyncio
+import numpy as np
 from src.config.run import logger
 from src.config.run import AudioConfig, VADConfig, VoiceState, ConversationState
 from src.text.run import ParallelOpenAIHandler
 
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None  # Neural VAD is optional, WebRTC VAD remains the default
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # Falls back to a character-based token estimate
+
+
+class SileroVADDetector:
+    """Silero neural VAD running 512-sample windows through onnxruntime"""
+
+    WINDOW_SIZE = 512  # Silero operates on 32ms windows at 16kHz
+
+    def __init__(self, model_path: str, sample_rate: int, threshold: float = 0.5):
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = 2
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=opts,
+            providers=['CPUExecutionProvider']
+        )
+        self.threshold = threshold
+        self._sr = np.array(sample_rate, dtype=np.int64)
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._pending = np.empty(0, dtype=np.float32)
+        self._last_decision = False
+
+    def is_speech(self, audio_data: bytes, sample_rate: int) -> bool:
+        """Buffer incoming frames and run inference per complete window"""
+        samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+        self._pending = np.concatenate((self._pending, samples))
+
+        # One inference per 512-sample window instead of a call per 20ms
+        # frame; decisions are sticky until the next window completes
+        while self._pending.size >= self.WINDOW_SIZE:
+            window = self._pending[:self.WINDOW_SIZE].reshape(1, -1)
+            self._pending = self._pending[self.WINDOW_SIZE:]
+            prob, self._state = self.session.run(
+                None, {'input': window, 'state': self._state, 'sr': self._sr}
+            )[:2]
+            self._last_decision = float(prob[0][0]) >= self.threshold
+
+        return self._last_decision
+
+    def reset(self):
+        """Reset recurrent state and pending samples"""
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._pending = np.empty(0, dtype=np.float32)
+        self._last_decision = False
+
+
 class WebRTCVADProcessor:
     """WebRTC Voice Activity Detection with smart buffering and output interference prevention"""
     
@@ -16,14 +73,37 @@ class WebRTCVADProcessor:
         
         # Initialize WebRTC VAD
         self.vad = webrtcvad.Vad(vad_config.aggressiveness)
-        
+
+        # Optional Silero neural VAD (better accuracy in noisy environments,
+        # fewer detector calls per second than the per-frame GMM)
+        self.silero = None
+        if vad_config.silero_model_path and onnxruntime is not None:
+            try:
+                self.silero = SileroVADDetector(
+                    vad_config.silero_model_path,
+                    audio_config.sample_rate,
+                    vad_config.silero_threshold
+                )
+                logger.info("🧠 Silero ONNX VAD enabled")
+            except Exception as e:
+                logger.error(f"Silero VAD init failed, falling back to WebRTC: {e}")
+
+        # Hot-path constants bound once so process_audio_frame (50Hz) skips
+        # the repeated attribute lookups
+        self._expected_frame_bytes = audio_config.chunk_size * 2
+        self._sample_rate = audio_config.sample_rate
+        self._start_threshold = vad_config.voice_start_threshold
+        self._end_threshold = vad_config.voice_end_threshold
+        self._detect_speech = (
+            self.silero.is_speech if self.silero is not None else self.vad.is_speech
+        )
+
         # Voice state tracking
         self.voice_state = VoiceState.SILENCE
         self.voice_frames = 0
         self.silence_frames = 0
         
-        # Audio buffering for voice sessions
-        self.voice_buffer = deque(maxlen=1000)
+        # Pre-voice context so the first syllable isn't clipped
         self.pre_voice_buffer = deque(maxlen=10)
         
         # Timing
@@ -40,6 +120,30 @@ class WebRTCVADProcessor:
         self.on_voice_start: Optional[Callable[[], None]] = None
         self.on_voice_data: Optional[Callable[[bytes], None]] = None
         self.on_voice_end: Optional[Callable[[], None]] = None
+
+        # Dedicated VAD thread: the audio callback only enqueues frames, so
+        # detector work and voice callbacks never run on the PortAudio thread
+        self._frame_queue = queue.SimpleQueue()
+        self._worker_running = True
+        self._worker = threading.Thread(target=self._vad_worker, daemon=True)
+        self._worker.start()
+
+    def _vad_worker(self):
+        """Drain queued frames and run detection off the audio callback thread"""
+        while self._worker_running:
+            frame = self._frame_queue.get()
+            if frame is None:  # Shutdown sentinel
+                break
+            try:
+                self._process_frame(frame)
+            except Exception as e:
+                logger.error(f"VAD worker error: {e}")
+
+    def shutdown(self):
+        """Stop the VAD worker thread"""
+        self._worker_running = False
+        self._frame_queue.put(None)
+        self._worker.join(timeout=1.0)
         
     def set_callbacks(
         self,
@@ -80,10 +184,15 @@ class WebRTCVADProcessor:
         return True
     
     def process_audio_frame(self, audio_data: bytes) -> VoiceState:
+        """Hand a frame to the VAD worker; returns the last known state"""
+        self._frame_queue.put_nowait(audio_data)
+        return self.voice_state
+
+    def _process_frame(self, audio_data: bytes) -> VoiceState:
         """Process single audio frame through VAD with output interference prevention"""
         try:
             # WebRTC VAD requires specific frame size
-            if len(audio_data) != self.audio_config.chunk_size * 2:
+            if len(audio_data) != self._expected_frame_bytes:
                 return self.voice_state
             
             # Skip VAD processing during output playback or cooldown
@@ -95,22 +204,19 @@ class WebRTCVADProcessor:
                 return VoiceState.SILENCE
             
             # Run VAD detection with adaptive thresholding
-            is_speech = self.vad.is_speech(audio_data, self.audio_config.sample_rate)
+            is_speech = self._detect_speech(audio_data, self._sample_rate)
             
             # Apply adaptive thresholding based on recent output
             if self.output_end_time and (time.time() - self.output_end_time) < 2.0:
                 # Be more conservative right after output
-                required_voice_frames = int(self.vad_config.voice_start_threshold * 1.5)
+                required_voice_frames = int(self._start_threshold * 1.5)
             else:
-                required_voice_frames = self.vad_config.voice_start_threshold
+                required_voice_frames = self._start_threshold
             
             if is_speech:
                 self.voice_frames += 1
                 self.silence_frames = 0
                 
-                # Always buffer current frame when speech is detected
-                self.voice_buffer.append(audio_data)
-                
                 # Check for voice start with adaptive threshold
                 if (self.voice_state == VoiceState.SILENCE and 
                     self.voice_frames >= required_voice_frames):
@@ -134,7 +240,7 @@ class WebRTCVADProcessor:
                 
                 # Check for voice end
                 elif (self.voice_state in [VoiceState.VOICE_START, VoiceState.VOICE_ACTIVE] and
-                      self.silence_frames >= self.vad_config.voice_end_threshold):
+                      self.silence_frames >= self._end_threshold):
                     
                     self._end_voice_session()
             
@@ -149,7 +255,6 @@ class WebRTCVADProcessor:
         self.voice_state = VoiceState.SILENCE
         self.voice_frames = 0
         self.silence_frames = 0
-        self.voice_buffer.clear()
         self.voice_start_time = None
     
     def _start_voice_session(self):
@@ -158,16 +263,12 @@ class WebRTCVADProcessor:
         self.voice_state = VoiceState.VOICE_START
         self.voice_start_time = time.time()
         
-        # Add pre-voice context to voice buffer
-        for frame in self.pre_voice_buffer:
-            self.voice_buffer.append(frame)
-        
         if self.on_voice_start:
             self.on_voice_start()
         
-        # Send buffered pre-voice + current voice data
+        # Send the buffered pre-voice context
         if self.on_voice_data:
-            for frame in list(self.voice_buffer)[-len(self.pre_voice_buffer)-3:]:
+            for frame in self.pre_voice_buffer:
                 self.on_voice_data(frame)
     
     def _end_voice_session(self):
@@ -192,6 +293,8 @@ class WebRTCVADProcessor:
         self._reset_voice_detection()
         self.pre_voice_buffer.clear()
         self.output_end_time = None
+        if self.silero is not None:
+            self.silero.reset()
 
 
 class ParallelStreamingSpeechConversation:
@@ -203,7 +306,8 @@ class ParallelStreamingSpeechConversation:
         vad_config: Optional[VADConfig] = None,
         openai_api_key: Optional[str] = None,
         system_prompt: str = "You are a helpful AI assistant. Keep responses concise and conversational.",
-        voice: str = "alloy"
+        voice: str = "alloy",
+        enable_speculative_prefill: bool = False
     ):
         self.audio_config = audio_config or AudioConfig()
         self.vad_config = vad_config or VADConfig()
@@ -215,18 +319,47 @@ class ParallelStreamingSpeechConversation:
         self.voice = voice
         self.state = ConversationState.IDLE
         self.conversation_context = []
+
+        # Token-aware history trimming: prefill cost scales directly with
+        # context tokens, so pack a budget instead of slicing 10 messages
+        self.context_token_budget = 1024
+        self._context_tokens = []  # Token count per conversation_context entry
+        self._encoder = None
+        if tiktoken is not None:
+            try:
+                self._encoder = tiktoken.encoding_for_model("gpt-4o-mini")
+            except Exception as e:
+                logger.error(f"tiktoken encoder unavailable: {e}")
         
-        # Voice session tracking
-        self.current_voice_session = []
+        # Voice session tracking: one preallocated buffer (30s at the input
+        # rate) filled in place, so an utterance costs zero allocations
+        self._utt_buf = bytearray(30 * self.audio_config.sample_rate * 2)
+        self._utt_len = 0
         self.voice_session_queue = asyncio.Queue()
+
+        # Interim transcription state (LocalAgreement-2)
+        self.interim_interval = 2.0  # seconds of speech between interim passes
+        self._last_interim_at = 0.0
+        self._prev_hyp = []          # Tokens of the previous interim hypothesis
+        self._confirmed_tokens = []  # Tokens agreed on by the last two hypotheses
+        self._loop = None            # Event loop, captured in start_conversation
+
+        # Speculative prefill: start GPT on a stabilized interim transcript
+        # while ASR is still running. Off by default - a cancelled
+        # speculation still bills the prompt tokens
+        self.enable_speculative_prefill = enable_speculative_prefill
+        self.speculative_min_tokens = 4  # Confirmed tokens required to speculate
+        self._speculative_task = None
+        self._speculative_text = None
         
-        # Response tracking
-        self.current_response_text = ""
+        # Response tracking (chunks are joined once on completion)
+        self._response_chunks = []
         self.response_sequence = 0
         self.is_generating_audio = False
         
         # Callbacks for parallel streams
         self.on_transcription: Optional[Callable[[str], None]] = None
+        self.on_transcription_partial: Optional[Callable[[str], None]] = None
         self.on_text_chunk: Optional[Callable[[str], None]] = None
         self.on_text_complete: Optional[Callable[[str], None]] = None
         self.on_audio_chunk: Optional[Callable[[bytes], None]] = None
@@ -236,6 +369,7 @@ class ParallelStreamingSpeechConversation:
         
         # Control
         self.is_running = False
+        self._stop_event = asyncio.Event()
         
         # Setup VAD callbacks
         self._setup_vad_callbacks()
@@ -246,23 +380,48 @@ class ParallelStreamingSpeechConversation:
             # Only process if we're not generating audio
             if not self.is_generating_audio:
                 self._change_state(ConversationState.VOICE_DETECTED)
-                self.current_voice_session = []
+                self._utt_len = 0
+                self._last_interim_at = time.time()
                 if self.on_voice_activity:
                     self.on_voice_activity(True)
-        
+
         def on_voice_data(audio_data: bytes):
             if not self.is_generating_audio:
-                self.current_voice_session.append(audio_data)
+                # Copy the frame into the preallocated buffer in place
+                end = self._utt_len + len(audio_data)
+                if end > len(self._utt_buf):
+                    logger.warning("Voice session buffer full, dropping frame")
+                    return
+                memoryview(self._utt_buf)[self._utt_len:end] = audio_data
+                self._utt_len = end
+
+                # Kick off an interim transcription pass every ~2s of speech
+                # so most of the utterance is already decoded at voice_end
+                if (self._loop is not None and
+                        time.time() - self._last_interim_at > self.interim_interval):
+                    self._last_interim_at = time.time()
+                    asyncio.run_coroutine_threadsafe(
+                        self._interim_transcribe(
+                            bytes(memoryview(self._utt_buf)[:self._utt_len])
+                        ),
+                        self._loop
+                    )
         
         def on_voice_end():
-            if self.current_voice_session and not self.is_generating_audio:
-                # Queue complete voice session for transcription
-                try:
-                    self.voice_session_queue.put_nowait(self.current_voice_session.copy())
-                except asyncio.QueueFull:
-                    logger.warning("Voice session queue full")
-                
-                self.current_voice_session = []
+            if self._utt_len and not self.is_generating_audio:
+                # Snapshot the session and hand it to the loop thread.
+                # asyncio.Queue is not thread-safe: a put_nowait from the
+                # VAD worker resolves the getter via plain call_soon,
+                # which never wakes a loop parked on _stop_event.wait()
+                session = bytes(memoryview(self._utt_buf)[:self._utt_len])
+                if self._loop is not None:
+                    self._loop.call_soon_threadsafe(
+                        self.voice_session_queue.put_nowait, session
+                    )
+                else:
+                    logger.warning("Event loop not running, dropping voice session")
+
+                self._utt_len = 0
                 self._change_state(ConversationState.LISTENING)
                 if self.on_voice_activity:
                     self.on_voice_activity(False)
@@ -272,6 +431,7 @@ class ParallelStreamingSpeechConversation:
     def set_callbacks(
         self,
         on_transcription: Optional[Callable[[str], None]] = None,
+        on_transcription_partial: Optional[Callable[[str], None]] = None,
         on_text_chunk: Optional[Callable[[str], None]] = None,
         on_text_complete: Optional[Callable[[str], None]] = None,
         on_audio_chunk: Optional[Callable[[bytes], None]] = None,
@@ -281,6 +441,7 @@ class ParallelStreamingSpeechConversation:
     ):
         """Set callbacks for parallel streaming events"""
         self.on_transcription = on_transcription
+        self.on_transcription_partial = on_transcription_partial
         self.on_text_chunk = on_text_chunk
         self.on_text_complete = on_text_complete
         self.on_audio_chunk = on_audio_chunk
@@ -299,7 +460,7 @@ class ParallelStreamingSpeechConversation:
         """Callback for text chunks (immediate display)"""
         if self.on_text_chunk:
             self.on_text_chunk(text_chunk)
-        self.current_response_text += text_chunk
+        self._response_chunks.append(text_chunk)
     
     def _audio_chunk_callback(self, audio_data: bytes):
         """Callback for audio chunks with VAD state management"""
@@ -313,31 +474,252 @@ class ParallelStreamingSpeechConversation:
         if self.on_audio_chunk:
             self.on_audio_chunk(audio_data)
     
+    async def _interim_transcribe(self, voice_session: bytes):
+        """Transcribe the in-progress voice session and confirm stable tokens"""
+        try:
+            hypothesis = await self.openai_handler.transcribe_voice_session(voice_session)
+            if not hypothesis:
+                return
+
+            tokens = hypothesis.split()
+
+            # LocalAgreement-2: the longest common prefix of the last two
+            # hypotheses is considered stable and committed
+            if self._prev_hyp:
+                agreed = 0
+                for prev_token, token in zip(self._prev_hyp, tokens):
+                    if prev_token.lower() != token.lower():
+                        break
+                    agreed += 1
+
+                if agreed > len(self._confirmed_tokens):
+                    self._confirmed_tokens = tokens[:agreed]
+
+                # Enough stable prefix: overlap text-only GPT prefill with
+                # the rest of the ASR decode
+                if (self.enable_speculative_prefill and
+                        self._speculative_task is None and
+                        len(self._confirmed_tokens) >= self.speculative_min_tokens):
+                    self._speculative_text = ' '.join(self._confirmed_tokens)
+                    logger.info(f"Speculative prefill on: {self._speculative_text}")
+                    self._speculative_task = asyncio.create_task(
+                        self._speculative_generate(self._speculative_text)
+                    )
+
+            self._prev_hyp = tokens
+
+        except Exception as e:
+            logger.error(f"Interim transcription error: {e}")
+
+    def _reset_interim_state(self):
+        """Clear interim hypotheses between utterances"""
+        self._prev_hyp = []
+        self._confirmed_tokens = []
+
+    async def _speculative_generate(self, spec_text: str) -> str:
+        """Generate a response for a stabilized interim prefix.
+
+        Deliberately side-effect-free: no context mutation, no state or
+        output-flag changes, no TTS - the user is still speaking, so
+        nothing here may disturb voice capture. _resolve_speculation
+        attaches the side effects only once the final transcript
+        confirms the prefix.
+        """
+        messages = [{"role": "system", "content": self.system_prompt}]
+        messages.extend(self._trimmed_context())
+        messages.append({"role": "user", "content": spec_text})
+        return await self.openai_handler.generate_text_response(messages)
+
+    async def _resolve_speculation(self, transcription: str) -> bool:
+        """Keep or cancel an in-flight speculative response for this transcript"""
+        spec_task = self._speculative_task
+        if spec_task is None:
+            return False
+
+        self._speculative_task = None
+        spec_text = self._speculative_text
+        self._speculative_text = None
+
+        if spec_text and transcription.lower().startswith(spec_text.lower()):
+            # The speculation was right - take its text and only now
+            # attach context, callbacks and TTS, under the full transcript
+            try:
+                response_text = await spec_task
+            except Exception as e:
+                logger.error(f"Speculative generation failed: {e}")
+                return False
+
+            if not response_text:
+                return False
+
+            await self._emit_response(transcription, response_text)
+            return True
+
+        # Diverged: the speculative text answers a prefix the user never
+        # finished saying. Generation was side-effect-free, so cancelling
+        # leaves no context entries or queued audio to unwind
+        logger.info("Speculative prefill diverged, cancelling")
+        spec_task.cancel()
+        await asyncio.gather(spec_task, return_exceptions=True)
+        return False
+
+    async def _discard_speculation(self):
+        """Cancel and clear a speculation no final transcript resolved"""
+        spec_task = self._speculative_task
+        self._speculative_task = None
+        self._speculative_text = None
+        if spec_task is None:
+            return
+        spec_task.cancel()
+        await asyncio.gather(spec_task, return_exceptions=True)
+
+    async def _emit_response(self, user_text: str, response_text: str):
+        """Record a completed turn and stream its TTS to playback.
+
+        Mirrors the tail of _process_user_input for text that was
+        generated ahead of time by a confirmed speculation.
+        """
+        try:
+            self.conversation_context.append({"role": "user", "content": user_text})
+            self._context_tokens.append(self._count_tokens(user_text))
+
+            self._change_state(ConversationState.RESPONDING)
+
+            # Reset current response
+            self._response_chunks = []
+            self.response_sequence += 1
+            self.is_generating_audio = True
+
+            self._text_chunk_callback(response_text)
+
+            await self.openai_handler.synthesize_response(
+                response_text, self._audio_chunk_callback, self.voice
+            )
+
+            # Add complete response to context
+            self.conversation_context.append({
+                "role": "assistant",
+                "content": response_text
+            })
+            self._context_tokens.append(self._count_tokens(response_text))
+
+            # Notify completion
+            if self.on_text_complete:
+                self.on_text_complete(response_text)
+
+            # Wait a moment for audio queue to finish, then notify VAD
+            await asyncio.sleep(0.5)
+            self.audio_processor.vad_processor.set_output_state(False)
+            self.is_generating_audio = False
+
+            if self.on_audio_complete:
+                self.on_audio_complete()
+
+            self._change_state(ConversationState.LISTENING)
+
+        except Exception as e:
+            logger.error(f"Response processing error: {e}")
+            self.is_generating_audio = False
+            self.audio_processor.vad_processor.set_output_state(False)
+            self._change_state(ConversationState.LISTENING)
+
+    async def _drain_voice_sessions(self, max_batch: int = 8, max_wait: float = 0.05):
+        """Collect up to max_batch queued voice sessions within a max_wait window"""
+        batch = [await self.voice_session_queue.get()]
+
+        deadline = self._loop.time() + max_wait
+        while len(batch) < max_batch:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(
+                    self.voice_session_queue.get(), timeout=remaining
+                ))
+            except asyncio.TimeoutError:
+                break
+
+        return [session for session in batch if session]
+
     async def _transcription_task(self):
         """Handle VAD-triggered transcription"""
         while self.is_running:
             try:
-                # Wait for complete voice session from VAD
-                voice_session = await self.voice_session_queue.get()
-                
-                if not voice_session:
+                # Drain up to 8 queued voice sessions (max 50ms extra wait)
+                # so backlogged utterances transcribe in parallel, not FIFO
+                batch = await self._drain_voice_sessions()
+
+                if not batch:
                     continue
-                
-                # Transcribe the complete voice session
-                transcription = await self.openai_handler.transcribe_voice_session(voice_session)
-                
-                if transcription and transcription.strip():
-                    logger.info(f"Transcribed: {transcription}")
-                    
-                    if self.on_transcription:
-                        self.on_transcription(transcription)
-                    
-                    # Trigger response generation
-                    await self._process_user_input(transcription)
-                    
+
+                # The interim-confirmed tokens belong to the most recent
+                # utterance, so only the last session gets the prompt bias
+                confirmed_text = ' '.join(self._confirmed_tokens)
+                results = await asyncio.gather(
+                    *[
+                        self.openai_handler.transcribe_voice_session(
+                            session,
+                            prompt=(confirmed_text or None) if i == len(batch) - 1 else None,
+                            # Partial deltas only make sense for one stream
+                            # at a time, so they follow the newest session
+                            on_partial=(
+                                self.on_transcription_partial
+                                if i == len(batch) - 1 else None
+                            )
+                        )
+                        for i, session in enumerate(batch)
+                    ],
+                    return_exceptions=True
+                )
+                self._reset_interim_state()
+
+                # Results come back in submission order, so arrival order
+                # is preserved for the conversation
+                for transcription in results:
+                    if isinstance(transcription, Exception):
+                        logger.error(f"Transcription error: {transcription}")
+                        continue
+
+                    if transcription and transcription.strip():
+                        logger.info(f"Transcribed: {transcription}")
+
+                        if self.on_transcription:
+                            self.on_transcription(transcription)
+
+                        # A matching speculative response already covers this
+                        # turn; a diverging one is cancelled and redone
+                        if await self._resolve_speculation(transcription):
+                            continue
+
+                        # Trigger response generation
+                        await self._process_user_input(transcription)
+
+                # A batch whose transcripts all came back empty or failed
+                # never reaches _resolve_speculation; drop its speculation
+                # so the task doesn't stay latched and block the next one
+                if self._speculative_task is not None:
+                    await self._discard_speculation()
+
             except Exception as e:
                 logger.error(f"Transcription task error: {e}")
     
+    def _count_tokens(self, text: str) -> int:
+        """Token count for budgeting (approximate without tiktoken)"""
+        if self._encoder is not None:
+            return len(self._encoder.encode(text))
+        return max(1, len(text) // 4)
+
+    def _trimmed_context(self) -> list:
+        """Most recent turns that fit the context token budget"""
+        total = 0
+        start = len(self.conversation_context)
+        for i in range(len(self.conversation_context) - 1, -1, -1):
+            total += self._context_tokens[i]
+            if total > self.context_token_budget and start < len(self.conversation_context):
+                break
+            start = i
+        return self.conversation_context[start:]
+
     async def _process_user_input(self, user_text: str):
         """Process user input and generate response"""
         try:
@@ -345,15 +727,16 @@ class ParallelStreamingSpeechConversation:
             
             # Add to conversation context
             self.conversation_context.append({"role": "user", "content": user_text})
+            self._context_tokens.append(self._count_tokens(user_text))
             
             # Prepare messages
             messages = [{"role": "system", "content": self.system_prompt}]
-            messages.extend(self.conversation_context[-10:])
+            messages.extend(self._trimmed_context())
             
             self._change_state(ConversationState.RESPONDING)
             
             # Reset current response
-            self.current_response_text = ""
+            self._response_chunks = []
             self.response_sequence += 1
             self.is_generating_audio = True
             
@@ -366,14 +749,16 @@ class ParallelStreamingSpeechConversation:
             )
             
             # Add complete response to context
+            response_text = ''.join(self._response_chunks)
             self.conversation_context.append({
                 "role": "assistant", 
-                "content": self.current_response_text
+                "content": response_text
             })
+            self._context_tokens.append(self._count_tokens(response_text))
             
             # Notify completion
             if self.on_text_complete:
-                self.on_text_complete(self.current_response_text)
+                self.on_text_complete(response_text)
             
             # Wait a moment for audio queue to finish, then notify VAD
             await asyncio.sleep(0.5)
@@ -395,11 +780,17 @@ class ParallelStreamingSpeechConversation:
         """Start parallel streaming conversation with enhanced VAD"""
         logger.info("Starting VAD-enabled parallel streaming conversation with output management...")
         self.is_running = True
+        self._loop = asyncio.get_running_loop()
+
+        # Warm the HTTP connection pool so the first whisper/TTS round trip
+        # doesn't pay the TLS handshake
+        await self.openai_handler.warmup()
         self._change_state(ConversationState.LISTENING)
         
-        # Start audio streams
-        self.audio_processor.start_input_stream()
-        self.audio_processor.start_output_stream()
+        # Start audio streams: one duplex stream when the configured
+        # rates match, otherwise it falls back to independent
+        # input/output streams
+        self.audio_processor.start_duplex_stream()
         
         # Start background tasks
         tasks = [
@@ -407,8 +798,10 @@ class ParallelStreamingSpeechConversation:
         ]
         
         try:
-            while self.is_running:
-                await asyncio.sleep(0.1)
+            # Sleep until stop_conversation fires instead of polling
+            # is_running every 100ms
+            self._stop_event.clear()
+            await self._stop_event.wait()
         except KeyboardInterrupt:
             logger.info("Conversation interrupted")
         finally:
@@ -422,6 +815,7 @@ class ParallelStreamingSpeechConversation:
         """Stop conversation and cleanup"""
         logger.info("Stopping conversation...")
         self.is_running = False
+        self._stop_event.set()
         self._change_state(ConversationState.IDLE)
         
         self.audio_processor.stop_streams()
@@ -1,9 +1,130 @@
-import queue
 from src.config.run import AudioConfig, VADConfig, pyaudio
 from src.vad.run import WebRTCVADProcessor, Optional, Callable
 from src.config.run import logger
+import logging
+import math
+import os
+import sys
 import threading
-import time
+
+
+def _raise_thread_priority():
+    """Best-effort real-time scheduling for the calling audio thread"""
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            # THREAD_PRIORITY_TIME_CRITICAL = 15
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 15)
+        except Exception as e:
+            logger.warning(f"Could not raise audio thread priority: {e}")
+        return
+
+    try:
+        # SCHED_FIFO bypasses CFS fairness so audio wakeups aren't delayed
+        # under CPU contention; needs CAP_SYS_NICE, so failure is expected
+        # for unprivileged runs
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        logger.info("Audio thread switched to SCHED_FIFO")
+    except (AttributeError, PermissionError, OSError) as e:
+        logger.warning(f"Could not raise audio thread priority: {e}")
+
+
+# Processor state bits, packed into one int so the per-frame loops do a
+# single attribute load instead of one per boolean flag
+_STREAMING = 1
+_PLAYING = 2
+
+
+class SPSCRingBuffer:
+    """Lock-free single-producer single-consumer byte ring buffer.
+
+    Each side owns one monotonic counter and only reads the other's, so
+    under the GIL no mutex or condition variable is needed on the audio
+    hot path.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._write_ct = 0  # Total bytes pushed (producer-owned)
+        self._read_ct = 0   # Total bytes popped (consumer-owned)
+        self._clear_pending = False  # Drain request, applied by the consumer
+
+    def available(self) -> int:
+        """Bytes ready to pop; a lock-free counter snapshot, safe to poll
+        from any thread without contending with the audio hot path"""
+        return self._write_ct - self._read_ct
+
+    def free(self) -> int:
+        """Space left for the producer"""
+        return self.capacity - self.available()
+
+    def push(self, data: bytes) -> bool:
+        """Producer side; returns False (data dropped) when full"""
+        n = len(data)
+        if n > self.free():
+            return False
+
+        pos = self._write_ct % self.capacity
+        first = min(n, self.capacity - pos)
+        self._view[pos:pos + first] = data[:first]
+        if first < n:
+            self._view[:n - first] = data[first:]
+
+        # Publish only after the bytes are in place
+        self._write_ct += n
+        return True
+
+    def pop(self, max_bytes: int) -> bytes:
+        """Consumer side; returns up to max_bytes (b'' when empty)"""
+        if self._clear_pending:
+            self._clear_pending = False
+            self._read_ct = self._write_ct
+        n = min(self.available(), max_bytes)
+        if n <= 0:
+            return b''
+
+        pos = self._read_ct % self.capacity
+        first = min(n, self.capacity - pos)
+        if first < n:
+            data = bytes(self._view[pos:pos + first]) + bytes(self._view[:n - first])
+        else:
+            data = bytes(self._view[pos:pos + first])
+
+        self._read_ct += n
+        return data
+
+    def pop_into(self, out: memoryview) -> int:
+        """Consumer side; copies up to len(out) bytes into out, returns count"""
+        if self._clear_pending:
+            self._clear_pending = False
+            self._read_ct = self._write_ct
+        n = min(self.available(), len(out))
+        if n <= 0:
+            return 0
+
+        pos = self._read_ct % self.capacity
+        first = min(n, self.capacity - pos)
+        out[:first] = self._view[pos:pos + first]
+        if first < n:
+            out[first:n] = self._view[:n - first]
+
+        self._read_ct += n
+        return n
+
+    def request_clear(self):
+        """Ask the consumer to drop everything currently buffered.
+
+        Safe from any thread: only a flag is written here, and the
+        consumer applies the drain at its next pop. Advancing _read_ct
+        directly from another thread could land mid-pop and push it past
+        _write_ct, making available() negative and silently swallowing
+        the next pushes.
+        """
+        self._clear_pending = True
+
 
 class StreamingAudioProcessor:
     """Handles continuous audio streaming with VAD integration and output interference prevention"""
@@ -11,21 +132,63 @@ class StreamingAudioProcessor:
     def __init__(self, config: AudioConfig, vad_config: VADConfig):
         self.config = config
         self.audio = pyaudio.PyAudio()
-        self.is_streaming = False
+        # _STREAMING | _PLAYING bitfield; int attribute writes are atomic
+        # under the GIL, so both threads flip bits without a lock
+        self._state = 0
         self.input_stream = None
         self.output_stream = None
-        self.audio_queue = queue.Queue()
+        self.duplex_stream = None
+        # SPSC ring between queue_audio (producer) and the playback worker
+        # (consumer). The capacity bound is the back-pressure policy: a
+        # producer outrunning playback by more than max_buffer_seconds has
+        # its newest chunks dropped (drop-oldest would garble speech)
+        self.audio_queue = SPSCRingBuffer(
+            math.ceil(config.max_buffer_seconds * config.output_sample_rate * 2)
+        )
         self.playback_thread = None
+        self._input_thread = None
         
         # VAD integration
         self.vad_processor = WebRTCVADProcessor(config, vad_config)
         self.voice_session_active = False
-        
-        # Output tracking for interference prevention
-        self.is_audio_playing = False
-        self.audio_start_time = None
-        self.last_audio_time = None
-        
+
+        # Reusable staging buffer between the ring and the output stream -
+        # the playback worker fills it in place instead of allocating a
+        # fresh chunk per 20ms frame. Sized at 8 chunks so small TTS
+        # sub-chunks that piled up in the ring leave in a single
+        # output_stream.write instead of one PortAudio call each
+        self._stage = bytearray(config.chunk_size * 2 * 8)
+        self._stage_view = memoryview(self._stage)
+
+        # One immutable silence frame shared by every underrun pad, so
+        # empty-queue intervals never allocate on the device callback
+        self._silence = bytes(
+            config.chunk_size * config.channels * pyaudio.get_sample_size(config.format)
+        )
+
+        # Producer -> worker wakeup; set on push so the worker sleeps
+        # instead of polling while the ring is empty
+        self._has_data = threading.Event()
+
+        # Reusable snapshot dict so a monitoring loop polling
+        # get_vad_state doesn't allocate a dict per call
+        self._vad_state_tpl = {
+            'voice_state': None,
+            'is_output_playing': False,
+            'output_cooldown': False,
+            'should_process_vad': True,
+            'audio_queue_size': 0
+        }
+
+    @property
+    def is_streaming(self) -> bool:
+        return bool(self._state & _STREAMING)
+
+    @property
+    def is_audio_playing(self) -> bool:
+        return bool(self._state & _PLAYING)
+
+
     def set_vad_callbacks(
         self,
         on_voice_start: Optional[Callable[[], None]] = None,
@@ -37,78 +200,190 @@ class StreamingAudioProcessor:
         
     def start_input_stream(self, callback: Optional[Callable[[bytes], None]] = None):
         """Start continuous audio input streaming with VAD"""
-        def audio_callback(in_data, frame_count, time_info, status):
-            if self.is_streaming:
-                # Process through VAD first
-                voice_state = self.vad_processor.process_audio_frame(in_data)
-                
+        # Blocking-read mode: a dedicated reader thread pulls frames, so
+        # PortAudio's real-time thread never enters the interpreter at all
+        self.input_stream = self.audio.open(
+            format=self.config.format,
+            channels=self.config.channels,
+            rate=self.config.sample_rate,
+            input=True,
+            frames_per_buffer=self.config.chunk_size
+        )
+
+        enqueue_frame = self.vad_processor.process_audio_frame
+        chunk_size = self.config.chunk_size
+
+        def input_reader():
+            """Read frames off the device and hand each to VAD by reference"""
+            _raise_thread_priority()
+
+            while self._state & _STREAMING:
+                try:
+                    # One 640-byte bytes object per 20ms frame. PyAudio
+                    # offers no read-into API and hides the PaStream
+                    # handle in a private capsule, so this allocation
+                    # can't be avoided without bypassing the binding;
+                    # everything downstream consumes it zero-copy
+                    in_data = self.input_stream.read(
+                        chunk_size, exception_on_overflow=False
+                    )
+                except Exception as e:
+                    if self._state & _STREAMING:
+                        logger.error("Input read error: %r", e)
+                    break
+
+                # One frame object shared by everyone downstream - the VAD
+                # queue, silero's np.frombuffer and the session buffer all
+                # consume it without copying
+                enqueue_frame(in_data)
+
                 # Optional raw audio callback (for debugging)
                 if callback:
                     callback(in_data)
-            
-            return (in_data, pyaudio.paContinue)
+
+        self._state |= _STREAMING
+        self.input_stream.start_stream()
+        self._input_thread = threading.Thread(target=input_reader, daemon=True)
+        self._input_thread.start()
+        logger.info("🎤 Input stream started with VAD processing")
         
-        self.input_stream = self.audio.open(
+    def start_duplex_stream(self):
+        """Run capture and playback from a single PortAudio duplex stream.
+
+        One device callback drives both directions, halving the wakeups
+        per frame period versus two independent streams. PortAudio makes
+        both directions share one rate, so with the default 16kHz capture
+        / 24kHz TTS output this falls back to the independent streams.
+        """
+        if self.config.output_sample_rate != self.config.sample_rate:
+            logger.info(
+                "Duplex stream needs matching rates (in %d Hz, out %d Hz); "
+                "using independent streams",
+                self.config.sample_rate, self.config.output_sample_rate
+            )
+            self.start_input_stream()
+            self.start_output_stream()
+            return
+
+        chunk_bytes = self.config.chunk_size * self.config.channels * 2
+        enqueue_frame = self.vad_processor.process_audio_frame
+        pop = self.audio_queue.pop
+        empty_calls = 0
+
+        def dup_cb(in_data, frame_count, time_info, status):
+            nonlocal empty_calls
+
+            enqueue_frame(in_data)
+
+            out = pop(chunk_bytes)
+            if out:
+                empty_calls = 0
+                if not self._state & _PLAYING:
+                    self._state |= _PLAYING
+                    self.vad_processor.set_output_state(True)
+                if len(out) < chunk_bytes:
+                    out += self._silence[:chunk_bytes - len(out)]
+            else:
+                # Underrun: pad with silence so the stream keeps running
+                out = self._silence
+                if self._state & _PLAYING:
+                    # 25 silent 20ms callbacks = 500ms, same policy as
+                    # the playback worker
+                    empty_calls += 1
+                    if empty_calls >= 25:
+                        self._state &= ~_PLAYING
+                        self.vad_processor.set_output_state(False)
+                        empty_calls = 0
+
+            return (out, pyaudio.paContinue)
+
+        self._state |= _STREAMING
+        self.duplex_stream = self.audio.open(
             format=self.config.format,
             channels=self.config.channels,
             rate=self.config.sample_rate,
             input=True,
+            output=True,
             frames_per_buffer=self.config.chunk_size,
-            stream_callback=audio_callback
+            stream_callback=dup_cb
         )
-        
-        self.is_streaming = True
-        self.input_stream.start_stream()
-        logger.info("🎤 Input stream started with VAD processing")
-        
+        self.duplex_stream.start_stream()
+        logger.info("🎧 Duplex stream started with VAD processing")
+
     def start_output_stream(self):
         """Start independent audio output stream with queue-based playback and VAD state management"""
         self.output_stream = self.audio.open(
             format=self.config.format,
             channels=self.config.channels,
-            rate=self.config.sample_rate,
+            rate=self.config.output_sample_rate,
             output=True,
             frames_per_buffer=self.config.chunk_size
         )
         
         def audio_playback_worker():
             """Worker thread for continuous audio playback with VAD state management"""
-            while self.is_streaming:
+            _raise_thread_priority()
+
+            stage_view = self._stage_view
+
+            # Silence is detected by counting timed-out waits: the
+            # playing->stopped transition is only evaluated once per
+            # 100ms timeout (and the counter resets on data), so the hot
+            # path makes no clock syscalls and no redundant state checks
+            empty_polls = 0
+
+            while (state := self._state) & _STREAMING:
                 try:
-                    audio_data = self.audio_queue.get(timeout=0.1)
-                    if audio_data and self.output_stream:
+                    n = self.audio_queue.pop_into(stage_view)
+                    if n and self.output_stream:
                         # Notify VAD that audio output is starting
-                        if not self.is_audio_playing:
-                            self.is_audio_playing = True
-                            self.audio_start_time = time.time()
+                        if not state & _PLAYING:
+                            # |= on the attribute, not a write-back of the
+                            # loop-top snapshot: a concurrent stop_streams
+                            # or force_stop between the snapshot and here
+                            # must not be undone
+                            self._state |= _PLAYING
                             self.vad_processor.set_output_state(True)
-                            logger.debug("🔊 Audio playback started")
-                        
-                        # Update last audio time
-                        self.last_audio_time = time.time()
-                        
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("🔊 Audio playback started")
+
+                        empty_polls = 0
+
                         # Play audio
-                        self.output_stream.write(audio_data)
-                    
-                    self.audio_queue.task_done()
-                    
-                except queue.Empty:
-                    # Check if we should stop audio playback state
-                    if (self.is_audio_playing and 
-                        self.last_audio_time and 
-                        time.time() - self.last_audio_time > 0.5):  # 500ms silence threshold
-                        
-                        self.is_audio_playing = False
-                        self.vad_processor.set_output_state(False)
-                        logger.debug("🔇 Audio playback stopped")
-                    
-                    continue
-                    
+                        self.output_stream.write(bytes(stage_view[:n]))
+                        continue
+
+                    # Ring is empty: sleep until the producer signals.
+                    # clear() can wipe a set() that raced it, so re-check
+                    # both the ring and the stop flag before parking -
+                    # otherwise the idle wait() could swallow the one
+                    # shutdown wakeup and park forever
+                    self._has_data.clear()
+                    if self.audio_queue.available():
+                        continue
+                    if not self._state & _STREAMING:
+                        break
+
+                    if state & _PLAYING:
+                        # Five timed-out 100ms waits = 500ms of silence
+                        if self._has_data.wait(timeout=0.1):
+                            continue
+                        empty_polls += 1
+                        if empty_polls >= 5:
+                            self._state &= ~_PLAYING
+                            self.vad_processor.set_output_state(False)
+                            if logger.isEnabledFor(logging.DEBUG):
+                                logger.debug("🔇 Audio playback stopped")
+                            empty_polls = 0
+                    else:
+                        # Idle: sleep until the producer (or shutdown) signals
+                        self._has_data.wait()
+
                 except Exception as e:
-                    logger.error(f"Audio playback error: {e}")
+                    logger.error("Audio playback error: %r", e)
                     # Reset audio state on error
-                    if self.is_audio_playing:
-                        self.is_audio_playing = False
+                    if self._state & _PLAYING:
+                        self._state &= ~_PLAYING
                         self.vad_processor.set_output_state(False)
         
         self.playback_thread = threading.Thread(target=audio_playback_worker, daemon=True)
@@ -117,24 +392,22 @@ class StreamingAudioProcessor:
         
     def queue_audio(self, audio_data: bytes):
         """Queue audio data for immediate playback"""
-        try:
-            self.audio_queue.put_nowait(audio_data)
-        except queue.Full:
-            logger.warning("Audio queue full, dropping audio chunk")
-    
+        if not self.audio_queue.push(audio_data):
+            logger.warning(
+                f"Audio queue full ({self.audio_queue.available()} bytes), dropping audio chunk"
+            )
+        else:
+            self._has_data.set()
+
     def force_stop_audio_output(self):
         """Force stop audio output and notify VAD immediately"""
-        # Clear audio queue
-        while not self.audio_queue.empty():
-            try:
-                self.audio_queue.get_nowait()
-                self.audio_queue.task_done()
-            except queue.Empty:
-                break
-        
+        # Ask the playback side to drain; applied within one pop (~a
+        # frame period) without racing the consumer's counters
+        self.audio_queue.request_clear()
+
         # Reset audio state
-        if self.is_audio_playing:
-            self.is_audio_playing = False
+        if self._state & _PLAYING:
+            self._state &= ~_PLAYING
             self.vad_processor.set_output_state(False)
             logger.info("🔇 Audio output force stopped")
     
@@ -143,17 +416,24 @@ class StreamingAudioProcessor:
         return self.is_audio_playing
     
     def get_audio_queue_size(self) -> int:
-        """Get current audio queue size"""
-        return self.audio_queue.qsize()
+        """Get current audio queue depth in bytes (mutex-free, so telemetry
+        polling never blocks the playback threads)"""
+        return self.audio_queue.available()
     
     def stop_streams(self):
         """Stop all audio streams"""
         logger.info("Stopping audio streams...")
-        self.is_streaming = False
-        
+        self._state &= ~_STREAMING
+        self._has_data.set()  # Wake the playback worker so it can exit
+
         # Force stop audio output
         self.force_stop_audio_output()
         
+        if self.duplex_stream:
+            self.duplex_stream.stop_stream()
+            self.duplex_stream.close()
+            logger.info("🎧 Duplex stream stopped")
+
         if self.input_stream:
             self.input_stream.stop_stream()
             self.input_stream.close()
@@ -164,28 +444,66 @@ class StreamingAudioProcessor:
             self.output_stream.close()
             logger.info("🔊 Output stream stopped")
             
+        if self._input_thread:
+            self._input_thread.join(timeout=1.0)
+            if self._input_thread.is_alive():
+                logger.warning("Input reader thread did not stop gracefully")
+
         if self.playback_thread:
             self.playback_thread.join(timeout=1.0)
             if self.playback_thread.is_alive():
                 logger.warning("Playback thread did not stop gracefully")
     
-    def cleanup(self):
-        """Clean up audio resources"""
+    def cleanup(self, sync: bool = False, timeout: float = 2.0):
+        """Clean up audio resources.
+
+        Stream close and PortAudio termination can take tens of
+        milliseconds joining internal threads, so by default they run on
+        a worker thread and the caller blocks at most `timeout` seconds.
+        Pass sync=True for a fully synchronous shutdown.
+        """
+        if sync:
+            self._shutdown_impl()
+            return
+
+        done = threading.Event()
+
+        def shutdown_runner():
+            try:
+                self._shutdown_impl()
+            finally:
+                done.set()
+
+        threading.Thread(target=shutdown_runner, daemon=True).start()
+        if not done.wait(timeout=timeout):
+            logger.warning(
+                "Audio cleanup still running after %.1fs; finishing in background",
+                timeout
+            )
+
+    def _shutdown_impl(self):
+        """Synchronous teardown of streams, VAD worker and PortAudio"""
         self.stop_streams()
-        
-        # Reset VAD processor
+
+        # Reset VAD processor and stop its worker thread
         self.vad_processor.reset()
-        
+        self.vad_processor.shutdown()
+
         # Terminate PyAudio
         self.audio.terminate()
         logger.info("Audio processor cleanup completed")
     
     def get_vad_state(self):
-        """Get current VAD state for debugging"""
-        return {
-            'voice_state': self.vad_processor.voice_state.value,
-            'is_output_playing': self.is_audio_playing,
-            'output_cooldown': self.vad_processor._is_in_output_cooldown(),
-            'should_process_vad': self.vad_processor._should_process_vad(),
-            'audio_queue_size': self.get_audio_queue_size()
-        }
\ No newline at end of file
+        """Get current VAD state for debugging.
+
+        Returns a reused snapshot dict - copy it if you need to retain
+        the values past the next call.
+        """
+        vad = self.vad_processor
+        state = self._vad_state_tpl
+        state['voice_state'] = vad.voice_state.value
+        state['is_output_playing'] = bool(self._state & _PLAYING)
+        state['output_cooldown'] = vad._is_in_output_cooldown()
+        state['should_process_vad'] = vad._should_process_vad()
+        state['audio_queue_size'] = self.audio_queue.available()
+        return state
\ No newline at end of file